@@ -0,0 +1,524 @@
+"""
+Load-test and latency benchmark for the web app in start_web.py.
+
+Builds a synthetic collection of random normalized embeddings backed by a small
+pool of stub images, then drives the web routes concurrently, either through the
+Flask test client or a local server, and reports p50/p95/p99 latency, throughput
+and RSS growth for each search backend.
+
+The CLIP model is never loaded: a stub text encoder returning random normalized
+vectors is installed in place of the model module before start_web is imported.
+
+Redirects are followed, so /random is timed through to the rendered /image/<id>
+page a browser would load next.
+
+Example:
+    python benchmark_web.py --sizes 10k 100k --concurrency 8 --requests 500
+    python benchmark_web.py --sizes 10k --mode server --json bench.json
+    python benchmark_web.py --sizes 10k --mode server --baseline bench.json
+"""
+import argparse
+import contextlib
+import http.client
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import chromadb
+import numpy as np
+from PIL import Image
+
+ROUTES = ["/", "/random", "/image/<id>", "/text-query", "/img/<id>"]
+BACKENDS = ["chroma", "chroma-memory"]
+QUERY_WORDS = ["dog", "cat", "beach", "sunset", "mountain", "city", "night", "forest", "car", "portrait"]
+# Embeddings are generated in fixed-size chunks so the data doesn't depend on --batch-size
+EMBEDDING_CHUNK = 1000
+MAX_REDIRECTS = 5
+DATASET_META_FILENAME = "meta.json"
+# Settings that change latency or throughput, a baseline must match them to be comparable
+COMPARABLE_SETTINGS = ["mode", "concurrency", "requests", "warmup", "dim", "image_pool", "seed"]
+
+logger = logging.getLogger("bench")
+
+
+def parse_size(value):
+    """
+    Parse a collection size such as 10000, 10k or 5M.
+
+    :param value: The size string.
+    :return: The size as an integer.
+    """
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    suffix = value[-1].lower()
+    if suffix in multipliers:
+        return int(float(value[:-1]) * multipliers[suffix])
+    return int(value)
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load-test and latency benchmark for the web app.")
+    parser.add_argument("--config", default=None, help="Config name in configs/ (defaults to config)")
+    parser.add_argument("--sizes", nargs="+", type=parse_size, default=[10_000],
+                        help="Synthetic collection sizes, e.g. 10k 100k 1M 5M")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--routes", nargs="+", choices=ROUTES, default=ROUTES)
+    parser.add_argument("--mode", choices=["client", "server"], default="client",
+                        help="Drive the app through the Flask test client or a local HTTP server")
+    parser.add_argument("--port", type=int, default=5055, help="Port for the local server in server mode")
+    parser.add_argument("--concurrency", type=positive_int, default=8)
+    parser.add_argument("--requests", type=positive_int, default=200, help="Measured requests per route")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests per route")
+    parser.add_argument("--dim", type=int, default=512, help="Embedding dimension")
+    parser.add_argument("--image-pool", type=int, default=32, help="Number of distinct stub image files")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Chroma insert batch size")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seeds the synthetic data, stub encoder and request mix "
+                             "(the app's own random choices in / and /random stay unseeded)")
+    parser.add_argument("--data-dir", default=None, help="Where synthetic data is stored (defaults to DATA_DIR/bench)")
+    parser.add_argument("--rebuild", action="store_true", help="Regenerate synthetic data even if it exists")
+    parser.add_argument("--json", default=None, help="Write results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="Compare against results from a previous --json run")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed relative p95/throughput regression against the baseline")
+    return parser.parse_args()
+
+
+def make_stub_model(dim, seed):
+    """
+    Build a stand-in for the model module whose encoders return random normalized vectors.
+    """
+    rng_lock = threading.Lock()
+    rng = np.random.default_rng(seed)
+
+    def text_embeddings(text):
+        with rng_lock:
+            vector = rng.standard_normal(dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    stub_model = types.ModuleType("model")
+    stub_model.text_embeddings = text_embeddings
+    stub_model.image_embeddings = text_embeddings
+    return stub_model
+
+
+def setup(args):
+    """
+    Load the config and install the stub encoder ahead of importing start_web.
+
+    :return: The loaded config.
+    """
+    # config.py reads the config name from sys.argv[1], so hide the benchmark options from it
+    sys.argv = [sys.argv[0]] + ([args.config] if args.config else [])
+    from config import config
+    from log_config import get_logger
+
+    get_logger("bench")
+    sys.modules["model"] = make_stub_model(args.dim, args.seed)
+    return config
+
+
+def image_id(index):
+    return f"bench_{index:08d}.jpg"
+
+
+def embedding_batch(start, end, dim, seed):
+    """
+    Deterministically generate normalized embeddings for ids in [start, end).
+    The same vectors are produced for every backend and batch size so results are comparable.
+    """
+    chunks = []
+    for chunk_start in range(start - start % EMBEDDING_CHUNK, end, EMBEDDING_CHUNK):
+        rng = np.random.default_rng((seed, chunk_start // EMBEDDING_CHUNK))
+        chunk = rng.standard_normal((EMBEDDING_CHUNK, dim)).astype(np.float32)
+        chunks.append(chunk[max(start, chunk_start) - chunk_start:min(end, chunk_start + EMBEDDING_CHUNK) - chunk_start])
+    vectors = np.concatenate(chunks)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.tolist()
+
+
+def set_data_paths(config, data_dir):
+    """
+    Point the config at the synthetic dataset so start_web never touches real data.
+    """
+    config.DATA_DIR = data_dir
+    config.SQLITE_DB_FILEPATH = os.path.join(data_dir, config.SQLITE_DB_FILENAME)
+    config.CHROMA_DB_PATH = os.path.join(data_dir, "chroma")
+
+
+def create_stub_images(image_dir, count, seed):
+    """
+    Write a pool of random noise JPEGs for the image routes to serve.
+
+    :return: A list of the stub image file paths.
+    """
+    os.makedirs(image_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        path = os.path.join(image_dir, f"stub_{i:04d}.jpg")
+        if not os.path.exists(path):
+            pixels = rng.integers(0, 256, (768, 1024, 3), dtype=np.uint8)
+            Image.fromarray(pixels).save(path, "JPEG", quality=85)
+        paths.append(path)
+    return paths
+
+
+def populate_sqlite(db_path, size, image_paths, batch_size):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS images (
+                id INTEGER PRIMARY KEY,
+                filename TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                file_date TEXT NOT NULL,
+                file_md5 TEXT NOT NULL,
+                embeddings BLOB
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_filename ON images (filename)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_file_path ON images (file_path)')
+        file_date = time.ctime()
+        for start in range(0, size, batch_size):
+            end = min(start + batch_size, size)
+            conn.executemany(
+                "INSERT INTO images (filename, file_path, file_date, file_md5) VALUES (?, ?, ?, ?)",
+                [(image_id(i), image_paths[i % len(image_paths)], file_date, "") for i in range(start, end)])
+    conn.close()
+    logger.info(f"Inserted {size} rows into {db_path}")
+
+
+def sqlite_row_count(db_path):
+    if not os.path.exists(db_path):
+        return 0
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+    except sqlite3.Error:
+        return 0
+    finally:
+        conn.close()
+
+
+def populate_collection(collection, size, args):
+    start_time = time.time()
+    for start in range(0, size, args.batch_size):
+        end = min(start + args.batch_size, size)
+        collection.add(embeddings=embedding_batch(start, end, args.dim, args.seed),
+                       ids=[image_id(i) for i in range(start, end)])
+        if end % (args.batch_size * 20) == 0:
+            logger.info(f"Added {end}/{size} embeddings to Chroma")
+    logger.info(f"Inserted {size} embeddings into Chroma in {time.time() - start_time:.2f} seconds")
+
+
+def dataset_meta(size, args):
+    """
+    The generation parameters a cached dataset must match to be reused.
+    """
+    return {"size": size, "dim": args.dim, "seed": args.seed, "image_pool": args.image_pool,
+            "embedding_chunk": EMBEDDING_CHUNK}
+
+
+def read_dataset_meta(data_dir):
+    try:
+        with open(os.path.join(data_dir, DATASET_META_FILENAME), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_dataset(config, size, args):
+    """
+    Create (or reuse) the synthetic SQLite table and stub images, and point the config at them.
+    Cached data generated with different parameters is discarded, along with its Chroma collection.
+    """
+    data_dir = os.path.join(args.data_dir or os.path.join(config.DATA_DIR, "bench"), f"size_{size}")
+    meta = dataset_meta(size, args)
+    if os.path.exists(data_dir) and (args.rebuild or read_dataset_meta(data_dir) != meta):
+        logger.info(f"Discarding cached dataset in {data_dir}")
+        shutil.rmtree(data_dir)
+    os.makedirs(data_dir, exist_ok=True)
+    with open(os.path.join(data_dir, DATASET_META_FILENAME), "w") as f:
+        json.dump(meta, f)
+    set_data_paths(config, data_dir)
+
+    image_paths = create_stub_images(os.path.join(data_dir, "images"), args.image_pool, args.seed)
+    if sqlite_row_count(config.SQLITE_DB_FILEPATH) != size:
+        if os.path.exists(config.SQLITE_DB_FILEPATH):
+            os.remove(config.SQLITE_DB_FILEPATH)
+        populate_sqlite(config.SQLITE_DB_FILEPATH, size, image_paths, args.batch_size)
+    else:
+        logger.info(f"Reusing {size} rows in {config.SQLITE_DB_FILEPATH}")
+
+
+def open_backend(config, name, size, args):
+    """
+    Return the client, a populated Chroma collection for the named backend and whether
+    the collection was built in this process rather than reused.
+    """
+    if name == "chroma":
+        client = chromadb.PersistentClient(path=config.CHROMA_DB_PATH)
+    else:
+        client = chromadb.EphemeralClient()
+    collection = client.get_or_create_collection(name=config.CHROMA_COLLECTION_NAME)
+    if collection.count() != size:
+        client.delete_collection(name=config.CHROMA_COLLECTION_NAME)
+        collection = client.create_collection(name=config.CHROMA_COLLECTION_NAME)
+        logger.info(f"Populating {name} backend with {size} embeddings")
+        populate_collection(collection, size, args)
+        return client, collection, True
+    logger.info(f"Reusing {size} embeddings in {name} backend")
+    return client, collection, False
+
+
+def release_backend(config, name, client):
+    # Ephemeral clients share one in-process store, free it before the next backend runs
+    if name == "chroma-memory":
+        client.delete_collection(name=config.CHROMA_COLLECTION_NAME)
+
+
+def request_path(route, size, rng):
+    if route == "/text-query":
+        return "/text-query?text=" + "+".join(rng.sample(QUERY_WORDS, 2))
+    if "<id>" in route:
+        return route.replace("<id>", image_id(rng.randrange(size)))
+    return route
+
+
+def current_rss_mb():
+    """
+    Resident set size of this process in MB, or None if it can't be determined.
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class ClientDriver:
+    """
+    Issues requests through a Flask test client, one per worker thread.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def get(self, path):
+        if not hasattr(self.local, "client"):
+            self.local.client = self.app.test_client()
+        response = self.local.client.get(path, follow_redirects=True)
+        response.get_data()
+        status = response.status_code
+        response.close()
+        return status
+
+    def close(self):
+        pass
+
+
+class ServerDriver:
+    """
+    Issues requests over HTTP to a threaded local werkzeug server.
+    """
+
+    def __init__(self, app, port):
+        from werkzeug.serving import make_server
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        self.port = port
+        self.server = make_server("127.0.0.1", port, app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def get(self, path):
+        for _ in range(MAX_REDIRECTS + 1):
+            conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=300)
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                location = response.getheader("Location")
+            finally:
+                conn.close()
+            if response.status not in (301, 302, 303, 307, 308) or not location:
+                return response.status
+            url = urlsplit(location)
+            path = url.path + ("?" + url.query if url.query else "")
+        return response.status
+
+    def close(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+
+
+def timed_get(driver, path):
+    start_time = time.perf_counter()
+    status = driver.get(path)
+    return time.perf_counter() - start_time, status
+
+
+def run_route(driver, route, size, args, rng):
+    """
+    Drive one route with the configured concurrency and summarize the results.
+    """
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(lambda p: driver.get(p), [request_path(route, size, rng) for _ in range(args.warmup)]))
+
+        paths = [request_path(route, size, rng) for _ in range(args.requests)]
+        start_time = time.perf_counter()
+        results = list(executor.map(lambda p: timed_get(driver, p), paths))
+        elapsed = time.perf_counter() - start_time
+
+    latencies = np.array([latency for latency, _ in results]) * 1000
+    errors = sum(1 for _, status in results if status >= 400)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "throughput_rps": len(results) / elapsed,
+    }
+
+
+def format_mb(value):
+    return "n/a" if value is None else f"{value:+.0f}"
+
+
+def print_results(results):
+    header = f"{'size':>9} {'backend':<14} {'data':<7} {'route':<12} {'reqs':>5} {'errs':>5} " \
+             f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'rss +MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['size']:>9} {r['backend']:<14} {r['data']:<7} {r['route']:<12} {r['requests']:>5} {r['errors']:>5} "
+              f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['throughput_rps']:>8.1f} "
+              f"{format_mb(r['rss_delta_mb']):>8}")
+    print("rss +MB: RSS growth while serving requests, measured after the collection was opened.")
+    print("data: 'built' collections were populated in this process and are already resident, "
+          "'reused' ones load from disk during the first requests.")
+
+
+def load_baseline(baseline_path, args):
+    """
+    Load results from a previous --json run, exiting if it was run with settings that aren't comparable.
+
+    :return: A dict of baseline results keyed by (size, backend, route, mode).
+    """
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+    settings = baseline.get("settings", {})
+    mismatched = [f"{key}: baseline {settings.get(key)!r}, this run {getattr(args, key)!r}"
+                  for key in COMPARABLE_SETTINGS if settings.get(key) != getattr(args, key)]
+    if mismatched:
+        sys.exit(f"Refusing to compare against {baseline_path}, settings differ:\n  " + "\n  ".join(mismatched))
+    return {(r["size"], r["backend"], r["route"], r["mode"]): r for r in baseline["results"]}
+
+
+def compare_to_baseline(results, baseline, baseline_path, tolerance):
+    """
+    Report rows whose p95 latency or throughput regressed beyond the tolerance.
+
+    :return: True if any regression was found.
+    """
+    regressed = False
+    matched = 0
+    for r in results:
+        base = baseline.get((r["size"], r["backend"], r["route"], r["mode"]))
+        if base is None:
+            continue
+        matched += 1
+        if r["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            print(f"REGRESSION {r['size']} {r['backend']} {r['route']}: "
+                  f"p95 {base['p95_ms']:.2f} ms -> {r['p95_ms']:.2f} ms")
+            regressed = True
+        if r["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            print(f"REGRESSION {r['size']} {r['backend']} {r['route']}: "
+                  f"throughput {base['throughput_rps']:.1f} -> {r['throughput_rps']:.1f} req/s")
+            regressed = True
+    if matched == 0:
+        print(f"No results match {baseline_path} (compare runs with the same sizes, backends and routes)")
+    elif not regressed:
+        print(f"No regressions against {baseline_path} (tolerance {tolerance:.0%})")
+    return regressed
+
+
+def main():
+    """
+    Build each synthetic dataset, benchmark every backend against it and report the results.
+    """
+    args = parse_args()
+    # Check the baseline up front rather than after the datasets are built
+    baseline = load_baseline(args.baseline, args) if args.baseline else None
+    config = setup(args)
+    request_rng = random.Random(args.seed)
+
+    results = []
+    driver = None
+    try:
+        for size in args.sizes:
+            build_dataset(config, size, args)
+            # start_web reads the config paths at import time, so import it once the first dataset exists
+            import start_web
+            if driver is None:
+                driver = ServerDriver(start_web.app, args.port) if args.mode == "server" else ClientDriver(start_web.app)
+
+            for backend in args.backends:
+                client, collection, built = open_backend(config, backend, size, args)
+                start_web.collection = collection
+                rss_before = current_rss_mb()
+                try:
+                    for route in args.routes:
+                        logger.info(f"Benchmarking {route} on {backend} with {size} images ({args.mode} mode)")
+                        # start_web prints every request's results, keep that out of the report
+                        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                            summary = run_route(driver, route, size, args, request_rng)
+                        rss_after = current_rss_mb()
+                        summary.update(size=size, backend=backend, route=route, mode=args.mode,
+                                       data="built" if built else "reused",
+                                       rss_delta_mb=None if rss_before is None else rss_after - rss_before)
+                        results.append(summary)
+                finally:
+                    release_backend(config, backend, client)
+    finally:
+        if driver is not None:
+            driver.close()
+
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")},
+                       "results": results}, f, indent=2)
+        logger.info(f"Wrote results to {args.json}")
+
+    if baseline is not None and compare_to_baseline(results, baseline, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()